@@ -13,89 +13,217 @@ las credenciales de un servidor SMTP válido (por ejemplo, Gmail con
 contraseña de aplicación).
 """
 
-import json
+import mmap
 import os
+import re
 import smtplib
-from email.mime.text import MIMEText
+from collections import namedtuple
+from email.message import EmailMessage
 from pathlib import Path
 
+import ahocorasick
+import msgspec
+import orjson
 
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 SUBS_FILE = DATA_DIR / "subscribers.json"
 
+# Máximo de licitaciones incluidas en cada correo
+MAX_ROWS = 20
+
+# Longitud máxima de línea (en bytes) que admite SMTP para cuerpos 8bit
+SMTP_MAX_LINE = 998
+
+# Plantillas del correo, compartidas por todos los suscriptores
+BODY_HEADER = """
+        <p>Hola,</p>
+        <p>A continuación encontrarás las licitaciones que coinciden con tus intereses:</p>
+        <ul>
+        """
+BODY_FOOTER = """ 
+        </ul>
+        <p>Gracias por usar LicitApp.</p>
+        <p><em>No respondas a este mensaje. Para cancelar tu suscripción envía un correo indicando tu email.</em></p>
+        """
+ROW_TMPL = (
+    "<li><strong>{titulo}</strong> – {organo}<br/>"
+    "<em>Provincia:</em> {provincia} | "
+    "<em>Límite:</em> {limite} | "
+    "<a href='{enlace}' target='_blank'>Ver</a></li>"
+)
+
+# Criterios de un suscriptor ya normalizados (minúsculas, sin vacíos); las
+# palabras clave se guardan compiladas en un autómata Aho-Corasick y las
+# provincias y tipos en una expresión regular con todas las alternativas
+Filtro = namedtuple("Filtro", ["keywords", "provs", "tipos", "min_importe"])
+
+
+class Tender(msgspec.Struct):
+    """Licitación con solo los campos que usan las alertas.
+
+    Los campos ``*_lc`` no vienen del JSON: se calculan al crearla para que
+    los filtros no repitan el paso a minúsculas por cada suscriptor.
+    """
+
+    titulo: str | None = None
+    organo: str | None = None
+    cpv: str | None = None
+    provincia: str | None = None
+    ccaa: str | None = None
+    tipo: str | None = None
+    importe: float | None = None
+    fechaLimite: str | None = None
+    enlace: str | None = None
+    loc_lc: str = ""
+    tipo_lc: str = ""
+    content_lc: str = ""
+
+    def __post_init__(self):
+        self.loc_lc = (self.provincia or self.ccaa or "").lower()
+        self.tipo_lc = (self.tipo or "").lower()
+        self.content_lc = " ".join([
+            self.titulo or "",
+            self.organo or "",
+            self.cpv or "",
+        ]).lower()
+
+
+TENDER_DECODER = msgspec.json.Decoder(Tender)
+
+
+def build_automaton(keywords: list):
+    """Compila las palabras clave en un autómata Aho-Corasick (None si no hay)."""
+    if not keywords:
+        return None
+    automaton = ahocorasick.Automaton()
+    for k in keywords:
+        automaton.add_word(k, k)
+    automaton.make_automaton()
+    return automaton
+
+
+def build_alternation(terms: list):
+    """Compila los términos en una única regex ``a|b|...`` (None si no hay)."""
+    if not terms:
+        return None
+    return re.compile("|".join(map(re.escape, terms)))
+
+
+def load_json(path: Path):
+    """Carga un fichero JSON mapeándolo en memoria para evitar copiarlo entero."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+
 
 def load_subscribers() -> list:
     if not SUBS_FILE.exists():
         return []
-    with open(SUBS_FILE, encoding="utf-8") as f:
-        return json.load(f)
+    return load_json(SUBS_FILE)
 
 
-def load_tenders() -> list:
-    # Leer el JSON de licitaciones activas (ya filtrado) para eficiencia
-    active_file = DATA_DIR / "tenders-active.json"
+def load_tenders():
+    """Itera las licitaciones activas (ya filtradas) como ``Tender``, línea a línea."""
+    active_file = DATA_DIR / "tenders-active.ndjson"
     if not active_file.exists():
-        return []
-    with open(active_file, encoding="utf-8") as f:
-        return json.load(f)
-
-
-def filter_tenders(sub, tenders: list) -> list:
-    """Filtra las licitaciones según los criterios de un suscriptor."""
-    keywords = [k.strip().lower() for k in sub.get("keywords", []) if k.strip()]
-    provs = [p.strip().lower() for p in sub.get("provincias", []) if p.strip()]
-    tipos = [t.strip().lower() for t in sub.get("tipos", []) if t.strip()]
-    min_importe = sub.get("importeMin") or 0
-
-    results = []
-    for lic in tenders:
-        # Filtro por importe
-        if min_importe:
-            imp = lic.get("importe") or 0
-            if imp < min_importe:
-                continue
-        # Filtro por provincias
-        if provs:
-            loc = (lic.get("provincia") or lic.get("ccaa") or "").lower()
-            if not any(p in loc for p in provs):
-                continue
-        # Filtro por tipos
-        if tipos:
-            tipo = (lic.get("tipo") or "").lower()
-            if not any(t in tipo for t in tipos):
-                continue
-        # Filtro por palabras clave
-        if keywords:
-            contenido = " ".join([
-                lic.get("titulo") or "",
-                lic.get("organo") or "",
-                lic.get("cpv") or "",
-            ]).lower()
-            if not any(k in contenido for k in keywords):
-                continue
-        results.append(lic)
-    return results
+        return
+    with open(active_file, "rb") as f:
+        for line in f:
+            if line.strip():
+                yield TENDER_DECODER.decode(line)
 
 
-def send_email(to_addr: str, subject: str, body: str):
-    host = os.getenv("SMTP_HOST")
-    user = os.getenv("SMTP_USER")
-    password = os.getenv("SMTP_PASS")
-    if not (host and user and password):
-        print("SMTP no configurado. No se envían correos.")
+def build_filter(sub) -> Filtro:
+    """Normaliza una sola vez los criterios de un suscriptor."""
+    return Filtro(
+        keywords=build_automaton(
+            [k.strip().lower() for k in sub.get("keywords", []) if k.strip()]
+        ),
+        provs=build_alternation(
+            [p.strip().lower() for p in sub.get("provincias", []) if p.strip()]
+        ),
+        tipos=build_alternation(
+            [t.strip().lower() for t in sub.get("tipos", []) if t.strip()]
+        ),
+        min_importe=sub.get("importeMin") or 0,
+    )
+
+
+def matches_tender(filtro: Filtro, lic: Tender) -> bool:
+    """Indica si una licitación cumple los criterios de un filtro."""
+    # Filtro por importe
+    if filtro.min_importe and (lic.importe or 0) < filtro.min_importe:
+        return False
+    # Filtro por provincias
+    if filtro.provs and not filtro.provs.search(lic.loc_lc):
+        return False
+    # Filtro por tipos
+    if filtro.tipos and not filtro.tipos.search(lic.tipo_lc):
+        return False
+    # Filtro por palabras clave
+    if filtro.keywords and next(filtro.keywords.iter(lic.content_lc), None) is None:
+        return False
+    return True
+
+
+def open_smtp(host: str, user: str, password: str) -> smtplib.SMTP:
+    """Abre una sesión SMTP autenticada para reutilizarla entre correos."""
+    server = smtplib.SMTP(host, 587)
+    try:
+        server.starttls()
+        server.login(user, password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def close_smtp(server: smtplib.SMTP | None):
+    """Cierra la sesión SMTP, aunque el servidor ya haya cortado la conexión."""
+    if server is None:
         return
-    msg = MIMEText(body, "html", "utf-8")
+    try:
+        server.quit()
+    except (smtplib.SMTPException, OSError):
+        server.close()
+
+
+def send_email(server: smtplib.SMTP, from_addr: str, to_addr: str, subject: str, body: str):
+    """Envía un correo HTML a través de una sesión SMTP ya autenticada.
+
+    Si el servidor anuncia ``8BITMIME`` (y ninguna línea supera el límite de
+    SMTP) el cuerpo UTF-8 se envía tal cual, sin codificarlo en base64 ni
+    quoted-printable.
+    """
+    eight_bit = server.has_extn("8bitmime") and all(
+        len(line) <= SMTP_MAX_LINE for line in body.encode("utf-8").splitlines()
+    )
+    msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = user
+    msg["From"] = from_addr
     msg["To"] = to_addr
-    try:
-        with smtplib.SMTP(host, 587) as server:
-            server.starttls()
-            server.login(user, password)
-            server.send_message(msg)
-        print(f"Enviado correo a {to_addr}")
-    except Exception as e:
-        print(f"Error enviando correo a {to_addr}: {e}")
+    msg.set_content(body, subtype="html", charset="utf-8", cte="8bit" if eight_bit else None)
+    server.send_message(msg, mail_options=("BODY=8BITMIME",) if eight_bit else ())
+
+
+def build_row(lic: Tender) -> str:
+    """Genera el elemento ``<li>`` de una licitación."""
+    return ROW_TMPL.format(
+        titulo=lic.titulo,
+        organo=lic.organo,
+        provincia=lic.provincia or lic.ccaa,
+        limite=lic.fechaLimite or "-",
+        enlace=lic.enlace,
+    )
+
+
+def build_body(matches: list) -> str:
+    """Construye el cuerpo HTML del correo con las licitaciones coincidentes."""
+    # matches ya está limitado a MAX_ROWS para correos manejables
+    return BODY_HEADER + "\n".join(build_row(lic) for lic in matches) + BODY_FOOTER
 
 
 def main():
@@ -103,36 +231,51 @@ def main():
     if not subscribers:
         print("No hay suscriptores")
         return
-    tenders = load_tenders()
-    if not tenders:
+    subscribers = [sub for sub in subscribers if sub.get("email")]
+    # Recorrer el flujo de licitaciones una sola vez, repartiendo cada una
+    # entre los suscriptores cuyos criterios cumple
+    filtros = [build_filter(sub) for sub in subscribers]
+    matches_by_sub = [[] for _ in subscribers]
+    total = 0
+    for lic in load_tenders():
+        total += 1
+        for filtro, matches in zip(filtros, matches_by_sub):
+            if len(matches) < MAX_ROWS and matches_tender(filtro, lic):
+                matches.append(lic)
+    if not total:
         print("No hay licitaciones cargadas")
         return
-    for sub in subscribers:
-        email = sub.get("email")
-        if not email:
-            continue
-        matches = filter_tenders(sub, tenders)
-        if not matches:
-            continue
-        # Construir cuerpo del email
-        rows = []
-        for lic in matches[:20]:  # limitar a 20 para correos manejables
-            fila = f"<li><strong>{lic.get('titulo')}</strong> – {lic.get('organo')}<br/>" \
-                   f"<em>Provincia:</em> {lic.get('provincia') or lic.get('ccaa')} | " \
-                   f"<em>Límite:</em> {lic.get('fechaLimite') or '-'} | " \
-                   f"<a href='{lic.get('enlace')}' target='_blank'>Ver</a></li>"
-            rows.append(fila)
-        body = """
-        <p>Hola,</p>
-        <p>A continuación encontrarás las licitaciones que coinciden con tus intereses:</p>
-        <ul>
-        {} 
-        </ul>
-        <p>Gracias por usar LicitApp.</p>
-        <p><em>No respondas a este mensaje. Para cancelar tu suscripción envía un correo indicando tu email.</em></p>
-        """.format("\n".join(rows))
-        subject = "Nuevas licitaciones de tu interés – LicitApp"
-        send_email(email, subject, body)
+    host = os.getenv("SMTP_HOST")
+    user = os.getenv("SMTP_USER")
+    password = os.getenv("SMTP_PASS")
+    if not (host and user and password):
+        print("SMTP no configurado. No se envían correos.")
+        return
+    # Una única sesión SMTP para todos los suscriptores; se reabre si el
+    # servidor corta la conexión
+    server = None
+    try:
+        for sub, matches in zip(subscribers, matches_by_sub):
+            if not matches:
+                continue
+            email = sub.get("email")
+            body = build_body(matches)
+            subject = "Nuevas licitaciones de tu interés – LicitApp"
+            try:
+                if server is None:
+                    server = open_smtp(host, user, password)
+                try:
+                    send_email(server, user, email, subject, body)
+                except smtplib.SMTPServerDisconnected:
+                    close_smtp(server)
+                    server = None
+                    server = open_smtp(host, user, password)
+                    send_email(server, user, email, subject, body)
+                print(f"Enviado correo a {email}")
+            except Exception as e:
+                print(f"Error enviando correo a {email}: {e}")
+    finally:
+        close_smtp(server)
 
 
 if __name__ == "__main__":
@@ -10,13 +10,23 @@ tres salidas:
 
 * ``data/tenders-active.json``: lista de licitaciones activas (vigentes y con
   fecha límite en el futuro o sin especificar).
+* ``data/tenders-active.ndjson``: las mismas licitaciones activas en formato
+  NDJSON, para consumirlas en streaming (lo usa ``enviar_alertas.py``).
 * ``data/tenders.ndjson``: archivo NDJSON con todas las licitaciones
   históricas (una entrada por línea).
 
 La variable de entorno ``LICITAI_START_YEAR`` permite ajustar el año de
 inicio de descarga (por defecto 2012). La variable ``LICITAI_ACTIVE_ONLY``
 determina si se genera también la lista de licitaciones activas (por defecto
-``true``).
+``true``). ``LICITAI_WORKERS`` fija el número de procesos que descargan y
+analizan los ZIP en paralelo (por defecto, uno por CPU).
+
+Las licitaciones ya extraídas de cada ZIP se guardan en ``data/cache/`` (o en
+``LICITAI_CACHE_DIR``). El mes actual y el anterior conservan también el ZIP y
+se revalidan con peticiones condicionales (``ETag``/``Last-Modified``), de
+modo que solo se vuelven a analizar si el servidor devuelve un fichero nuevo.
+Los meses anteriores se revalidan una última vez al cerrarse y después se leen
+siempre de la caché.
 
 Uso:
 
@@ -26,16 +36,18 @@ Nota: Este script está pensado para ejecutarse como parte de una GitHub
 Action. No necesita argumentos de línea de comandos.
 """
 
-import io
-import json
 import os
 import re
 import zipfile
 import datetime as dt
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
 from urllib.parse import urljoin
 
+import orjson
 import requests
-import xml.etree.ElementTree as ET
+from lxml import etree
 
 
 # Base de la sindicación para licitaciones de perfiles del contratante
@@ -52,6 +64,65 @@ ZIP_PATTERNS = [
 
 HEADERS = {"User-Agent": "LicitApp-sync/1.0"}
 
+# Enlaces a ZIP en el listado del directorio de la sindicación
+ZIP_HREF_RE = re.compile(r'href="([^"]+\.zip)"', re.I)
+
+# Meses encargados por proceso a la vez (en curso o pendientes de consumir)
+MAX_IN_FLIGHT_PER_WORKER = 2
+
+# Conexiones HTTP que se mantienen abiertas por sesión (una por hilo de E/S)
+HTTP_POOL_SIZE = 16
+
+# Caché en disco de ZIP mensuales y de las licitaciones extraídas de ellos
+CACHE_DIR = os.getenv("LICITAI_CACHE_DIR") or os.path.abspath(
+    os.path.join(os.path.dirname(__file__), os.pardir, "data", "cache")
+)
+# Tamaño de los bloques con que se vuelca la descarga a disco
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Se incrementa cuando cambia parse_entry, para invalidar lo ya analizado
+CACHE_VERSION = 1
+
+# Tres primeros números de la fecha límite: día, mes y año (dd/mm/yyyy [HH:MM])
+DATE_RE = re.compile(r"\D*(\d+)\D+(\d+)\D+(\d+)")
+
+ZIP_MONTH_RE = re.compile(r"_(\d{4})(\d{2})\.zip$")
+
+_session = None
+_session_pid = None
+
+# Etiquetas Atom en notación Clark, para no resolver prefijos en cada búsqueda
+ATOM = "{http://www.w3.org/2005/Atom}"
+ATOM_ENTRY = ATOM + "entry"
+ATOM_LINK = ATOM + "link"
+ATOM_TITLE = ATOM + "title"
+ATOM_SUMMARY = ATOM + "summary"
+
+# Campos extraídos del resumen de cada entrada: (clave, etiqueta, valor)
+SUMMARY_FIELDS = [
+    ("ident", r"Identificador:", r"[^\n<]+"),
+    ("organo", r"Órgano de Contratación:", r"[^\n<]+"),
+    ("estado", r"Estado:", r"[^\n<]+"),
+    ("importe", r"Importe(?:\s+de\s+Licitación)?:", r"[0-9\.,]+"),
+    ("cpv", r"CPV:", r"[0-9\- ]+"),
+    ("tipo", r"Tipo de Contrato:", r"[^\n<]+"),
+    ("ccaa", r"CCAA:", r"[^\n<]+"),
+    ("provincia", r"Provincia:", r"[^\n<]+"),
+    ("fpub", r"Fecha de Publicación:", r"[0-9/\-]+"),
+    ("ffin", r"Fecha Límite de Presentación:", r"[0-9/\-: ]+"),
+]
+
+# Una única expresión con todas las etiquetas. El valor se captura dentro de
+# un lookahead para que solo se consuma la etiqueta: así varias etiquetas en
+# la misma línea se siguen encontrando y el resultado coincide con buscar cada
+# patrón por separado, pero recorriendo el resumen una sola vez.
+SUMMARY_RE = re.compile(
+    "|".join(
+        rf"{label}(?=\s*(?P<{key}>{value}))" for key, label, value in SUMMARY_FIELDS
+    ),
+    re.I,
+)
+
 
 def month_range(start_year: int) -> list:
     """Genera una lista de cadenas AAAAMM desde start_year hasta el mes actual."""
@@ -66,12 +137,55 @@ def month_range(start_year: int) -> list:
     return months
 
 
+def http_session() -> requests.Session:
+    """Devuelve la sesión HTTP del proceso actual, reutilizando conexiones TCP/TLS.
+
+    Cada proceso del pool crea la suya para no compartir sockets heredados.
+    """
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        _session = requests.Session()
+        _session.headers.update(HEADERS)
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+        _session_pid = os.getpid()
+    return _session
+
+
+def fetch_zip_index() -> dict:
+    """Descarga una vez el listado de BASE_URL y devuelve {nombre de ZIP: URL}.
+
+    Devuelve un diccionario vacío si el listado no está disponible.
+    """
+    try:
+        r = http_session().get(BASE_URL, timeout=60)
+        r.raise_for_status()
+    except Exception as exc:
+        print(f"No se pudo obtener el listado de {BASE_URL}: {exc}")
+        return {}
+    index = {}
+    for href in ZIP_HREF_RE.findall(r.text):
+        url = urljoin(BASE_URL, href)
+        index[url.rsplit("/", 1)[-1]] = url
+    return index
+
+
+def find_zip_in_index(ym: str, index: dict) -> str | None:
+    """Busca en el listado el ZIP de un mes respetando el orden de ZIP_PATTERNS."""
+    for pattern in ZIP_PATTERNS:
+        url = index.get(pattern.format(ym=ym))
+        if url:
+            return url
+    return None
+
+
 def find_existing_zip(ym: str) -> str | None:
     """Dada una cadena AAAAMM devuelve la URL del ZIP que existe, probando patrones."""
     for pattern in ZIP_PATTERNS:
         url = urljoin(BASE_URL, pattern.format(ym=ym))
         try:
-            r = requests.head(url, headers=HEADERS, timeout=30, allow_redirects=True)
+            r = http_session().head(url, timeout=30, allow_redirects=True)
             if r.status_code == 200:
                 return url
         except Exception:
@@ -79,9 +193,36 @@ def find_existing_zip(ym: str) -> str | None:
     return None
 
 
-def iter_atom_entries_from_zip(zip_bytes: bytes):
-    """Itera sobre las entradas de los ficheros Atom dentro del ZIP."""
-    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as z:
+def iter_atom_stream(atom_fp):
+    """Itera en streaming las entradas de un fichero Atom liberando memoria.
+
+    Devuelve (como valor de retorno del generador) el enlace ``next`` del feed
+    si lo hay, para seguir la paginación.
+    """
+    next_href = None
+    for _, elem in etree.iterparse(atom_fp, events=("end",), tag=(ATOM_ENTRY, ATOM_LINK)):
+        if elem.tag == ATOM_LINK:
+            # Solo interesan los enlaces del propio feed, no los de las entradas
+            parent = elem.getparent()
+            if (
+                next_href is None
+                and parent is not None
+                and parent.getparent() is None
+                and elem.get("rel") == "next"
+            ):
+                next_href = elem.get("href")
+            continue
+        yield elem
+        # Liberar la entrada ya procesada y las anteriores
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return next_href
+
+
+def iter_atom_entries_from_zip(zip_file):
+    """Itera sobre las entradas de los ficheros Atom dentro del ZIP (ruta o fichero)."""
+    with zipfile.ZipFile(zip_file) as z:
         # Buscar el fichero Atom principal (termina en .atom o .xml)
         atom_name = None
         for name in z.namelist():
@@ -90,54 +231,50 @@ def iter_atom_entries_from_zip(zip_bytes: bytes):
                 break
         if not atom_name:
             return
-        content = z.read(atom_name)
-        root = ET.fromstring(content)
-        ns = {"a": "http://www.w3.org/2005/Atom"}
         # Recorrer las entradas
-        for entry in root.findall("a:entry", ns):
-            yield entry, ns
+        with z.open(atom_name) as atom_fp:
+            next_href = yield from iter_atom_stream(atom_fp)
         # Si hay paginación, seguir los enlaces "next"
-        next_link = root.find("a:link[@rel='next']", ns)
-        if next_link is not None:
-            next_href = next_link.get("href")
-            if next_href:
-                try:
-                    with z.open(next_href) as next_atom:
-                        next_content = next_atom.read()
-                    next_root = ET.fromstring(next_content)
-                    for entry in next_root.findall("a:entry", ns):
-                        yield entry, ns
-                except KeyError:
-                    pass
-
-
-def extract_text(elem, tag: str, ns: dict) -> str:
+        if next_href:
+            try:
+                with z.open(next_href) as next_atom:
+                    yield from iter_atom_stream(next_atom)
+            except KeyError:
+                pass
+
+
+def extract_text(elem, tag: str) -> str:
     """Obtiene el texto de la etiqueta tag dentro del elemento XML, devolviendo cadena vacía si no existe."""
-    found = elem.find(tag, ns)
+    found = elem.find(tag)
     return (found.text or "").strip() if found is not None else ""
 
 
-def parse_entry(entry, ns: dict) -> dict:
+def parse_entry(entry) -> dict:
     """Extrae los campos de una entrada Atom en un diccionario."""
-    titulo = extract_text(entry, "a:title", ns)
-    link_elem = entry.find("a:link", ns)
+    titulo = extract_text(entry, ATOM_TITLE)
+    link_elem = entry.find(ATOM_LINK)
     enlace = link_elem.get("href") if link_elem is not None else ""
-    summary = extract_text(entry, "a:summary", ns)
-
-    def rex(pattern: str) -> str:
-        m = re.search(pattern, summary, re.I)
-        return m.group(1).strip() if m else ""
-
-    ident = rex(r"Identificador:\s*([^\n<]+)") or enlace or titulo
-    organo = rex(r"Órgano de Contratación:\s*([^\n<]+)")
-    estado = rex(r"Estado:\s*([^\n<]+)")
-    importe = rex(r"Importe(?:\s+de\s+Licitación)?:\s*([0-9\.,]+)")
-    cpv = rex(r"CPV:\s*([0-9\- ]+)")
-    tipo = rex(r"Tipo de Contrato:\s*([^\n<]+)")
-    ccaa = rex(r"CCAA:\s*([^\n<]+)")
-    provincia = rex(r"Provincia:\s*([^\n<]+)")
-    fpub = rex(r"Fecha de Publicación:\s*([0-9/\-]+)")
-    ffin = rex(r"Fecha Límite de Presentación:\s*([0-9/\-: ]+)")
+    summary = extract_text(entry, ATOM_SUMMARY)
+
+    # Quedarse con la primera aparición de cada campo
+    campos = {}
+    for m in SUMMARY_RE.finditer(summary):
+        key = m.lastgroup
+        if key not in campos:
+            campos[key] = m.group(key).strip()
+            if len(campos) == len(SUMMARY_FIELDS):
+                break
+
+    ident = campos.get("ident") or enlace or titulo
+    organo = campos.get("organo", "")
+    estado = campos.get("estado", "")
+    importe = campos.get("importe", "")
+    cpv = campos.get("cpv", "")
+    tipo = campos.get("tipo", "")
+    ccaa = campos.get("ccaa", "")
+    provincia = campos.get("provincia", "")
+    fpub = campos.get("fpub", "")
+    ffin = campos.get("ffin", "")
 
     def to_float(x: str):
         if not x:
@@ -165,8 +302,11 @@ def parse_entry(entry, ns: dict) -> dict:
     }
 
 
-def is_active(lic: dict) -> bool:
-    """Determina si una licitación está activa basada en su estado y fecha límite."""
+def is_active(lic: dict, today: dt.date | None = None) -> bool:
+    """Determina si una licitación está activa basada en su estado y fecha límite.
+
+    ``today`` permite calcular la fecha actual una sola vez para todo el lote.
+    """
     estado = (lic.get("estado") or "").lower()
     if "anulada" in estado or "suspend" in estado:
         return False
@@ -174,64 +314,227 @@ def is_active(lic: dict) -> bool:
     ffin = lic.get("fechaLimite") or ""
     # Intenta parsear dd/mm/yyyy o similar
     if ffin:
-        parts = re.findall(r"\d+", ffin)
-        if len(parts) >= 3:
+        m = DATE_RE.match(ffin)
+        if m:
             try:
-                d, m, y = int(parts[0]), int(parts[1]), int(parts[2])
-                fin_date = dt.date(y, m, d)
-                if fin_date < dt.date.today():
-                    return False
-            except Exception:
-                pass
+                fin_date = dt.date(int(m[3]), int(m[2]), int(m[1]))
+            except (ValueError, OverflowError):
+                return True
+            if fin_date < (today or dt.date.today()):
+                return False
     return True
 
 
+def write_atomic(path: str, chunks):
+    """Escribe un fichero de la caché de forma atómica a partir de bloques de bytes."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def read_cache(path: str):
+    """Lee un JSON de la caché, devolviendo None si no existe o no es válido."""
+    try:
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+
+
+def parse_zip(zip_file) -> tuple[dict, int]:
+    """Extrae las licitaciones de un ZIP por id junto con el total de entradas."""
+    licitaciones = {}
+    total_raw = 0
+    for entry in iter_atom_entries_from_zip(zip_file):
+        lic = parse_entry(entry)
+        if not lic["id"]:
+            continue
+        licitaciones[lic["id"]] = lic
+        total_raw += 1
+    return licitaciones, total_raw
+
+
+def is_historical(name: str, today: dt.date) -> bool:
+    """Indica si el ZIP es de un mes cerrado que ya no se revalida.
+
+    Se revalidan siempre el mes actual y el anterior (aunque sea de otro año),
+    porque PLACSP sigue actualizando el fichero del mes recién terminado.
+    """
+    m = ZIP_MONTH_RE.search(name)
+    if not m:
+        return False
+    prev_year, prev_month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+    return (int(m.group(1)), int(m.group(2))) < (prev_year, prev_month)
+
+
+def remove_quietly(path: str):
+    """Borra un fichero de la caché si existe."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def download_and_parse(url: str) -> tuple[dict, int]:
+    """Descarga un ZIP mensual y devuelve sus licitaciones por id y el total de entradas.
+
+    Usa la caché en disco: los dos últimos meses conservan el ZIP y se
+    revalidan con una petición condicional. Un mes cerrado se revalida una
+    última vez y entonces se marca como definitivo (``final``): a partir de ahí
+    solo se guardan sus licitaciones ya extraídas y no se vuelve a pedir. Se
+    ejecuta en un proceso aparte, por lo que los errores de red o de formato se
+    notifican aquí y se devuelve un resultado vacío. Los errores de disco, en
+    cambio, se propagan para no publicar un histórico incompleto.
+    """
+    name = url.rsplit("/", 1)[-1]
+    zip_path = os.path.join(CACHE_DIR, name)
+    meta_path = zip_path + ".meta.json"
+    parsed_path = zip_path + ".parsed.json"
+    historical = is_historical(name, dt.date.today())
+
+    parsed = read_cache(parsed_path)
+    if parsed and parsed.get("version") != CACHE_VERSION:
+        parsed = None
+    if historical and parsed and parsed.get("final"):
+        return parsed["licitaciones"], parsed["total_raw"]
+
+    meta = read_cache(meta_path) or {}
+    cached = os.path.exists(zip_path)
+    try:
+        headers = {}
+        if cached:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        print(f"Descargando {url}")
+        # La respuesta se vuelca a disco por bloques en lugar de mantener el
+        # ZIP completo en memoria; después se lee directamente del fichero
+        with http_session().get(url, headers=headers, timeout=120, stream=True) as resp:
+            not_modified = resp.status_code == 304 and parsed
+            if not_modified:
+                if not historical:
+                    return parsed["licitaciones"], parsed["total_raw"]
+            elif resp.status_code != 304:
+                resp.raise_for_status()
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                write_atomic(zip_path, resp.iter_content(DOWNLOAD_CHUNK_SIZE))
+                write_atomic(meta_path, [orjson.dumps({
+                    "etag": resp.headers.get("ETag"),
+                    "last_modified": resp.headers.get("Last-Modified"),
+                })])
+
+        if not_modified:
+            licitaciones, total_raw = parsed["licitaciones"], parsed["total_raw"]
+        else:
+            licitaciones, total_raw = parse_zip(zip_path)
+    except OSError as exc:
+        # requests.RequestException hereda de OSError: solo se toleran los de red
+        if not isinstance(exc, requests.RequestException):
+            raise
+        print(f"Error al procesar {url}: {exc}")
+        return {}, 0
+    except Exception as exc:
+        print(f"Error al procesar {url}: {exc}")
+        return {}, 0
+
+    # Un fallo al guardar lo analizado no debe descartar el mes: se avisa y
+    # la próxima ejecución lo volverá a procesar
+    try:
+        write_atomic(parsed_path, [orjson.dumps({
+            "version": CACHE_VERSION,
+            "licitaciones": licitaciones,
+            "total_raw": total_raw,
+            "final": historical,
+        })])
+    except OSError as exc:
+        print(f"No se pudo guardar en caché {parsed_path}: {exc}")
+    else:
+        if historical:
+            # Revalidado ya como mes cerrado: no se vuelve a pedir y el ZIP
+            # ya no hace falta
+            remove_quietly(zip_path)
+            remove_quietly(meta_path)
+    return licitaciones, total_raw
+
+
 def main():
     start_year = int(os.getenv("LICITAI_START_YEAR", "2012"))
     active_only = os.getenv("LICITAI_ACTIVE_ONLY", "true").lower() == "true"
     out_dir = os.path.join(os.path.dirname(__file__), os.pardir, "data")
     out_dir = os.path.abspath(out_dir)
+    workers = int(os.getenv("LICITAI_WORKERS", "0")) or None
     os.makedirs(out_dir, exist_ok=True)
 
-    licitaciones = {}
+    seen = set()
+    active_lics = []
     total_raw = 0
+    today = dt.date.today()
 
     print(f"Descargando licitaciones desde el año {start_year}…")
-    for ym in month_range(start_year):
-        url = find_existing_zip(ym)
-        if not url:
-            continue
-        print(f"Descargando {url}")
-        try:
-            resp = requests.get(url, headers=HEADERS, timeout=120)
-            resp.raise_for_status()
-            for entry, ns in iter_atom_entries_from_zip(resp.content):
-                lic = parse_entry(entry, ns)
-                if not lic["id"]:
+    # Localizar los ZIP de cada mes con una sola petición al listado; si no
+    # está disponible, probar los patrones en paralelo (solo E/S de red)
+    months = month_range(start_year)
+    index = fetch_zip_index()
+    if index:
+        urls = [find_zip_in_index(ym, index) for ym in months]
+    else:
+        with ThreadPoolExecutor(HTTP_POOL_SIZE) as io_pool:
+            urls = list(io_pool.map(find_existing_zip, months))
+    urls = [url for url in urls if url]
+
+    # Descargar y analizar cada mes en un proceso propio, del más reciente al
+    # más antiguo: así la primera versión vista de cada id es la más reciente
+    # y cada licitación se vuelca al NDJSON en cuanto llega. Solo hay
+    # MAX_IN_FLIGHT_PER_WORKER meses por proceso en curso o esperando a ser
+    # consumidos, de modo que en memoria quedan los ids vistos, las activas y
+    # unos pocos meses, no todo el histórico.
+    ndjson_path = os.path.join(out_dir, "tenders.ndjson")
+    tmp_path = ndjson_path + ".tmp"
+    max_in_flight = (workers or os.cpu_count() or 1) * MAX_IN_FLIGHT_PER_WORKER
+    pending_urls = reversed(urls)
+    with open(tmp_path, "wb") as f, ProcessPoolExecutor(workers) as cpu_pool:
+        pending = deque(
+            cpu_pool.submit(download_and_parse, url)
+            for url in islice(pending_urls, max_in_flight)
+        )
+        while pending:
+            month_lics, month_raw = pending.popleft().result()
+            url = next(pending_urls, None)
+            if url:
+                pending.append(cpu_pool.submit(download_and_parse, url))
+            total_raw += month_raw
+            for lic_id, lic in month_lics.items():
+                if lic_id in seen:
                     continue
-                licitaciones[lic["id"]] = lic
-                total_raw += 1
-        except Exception as exc:
-            print(f"Error al procesar {url}: {exc}")
-            continue
+                seen.add(lic_id)
+                f.write(orjson.dumps(lic))
+                f.write(b"\n")
+                if active_only and is_active(lic, today):
+                    active_lics.append(lic)
+    os.replace(tmp_path, ndjson_path)
 
     print(f"Total entradas crudas: {total_raw}")
-    all_lics = list(licitaciones.values())
-    print(f"Total licitaciones únicas: {len(all_lics)}")
-
-    # Guardar NDJSON completo
-    ndjson_path = os.path.join(out_dir, "tenders.ndjson")
-    with open(ndjson_path, "w", encoding="utf-8") as f:
-        for lic in all_lics:
-            f.write(json.dumps(lic, ensure_ascii=False) + "\n")
+    print(f"Total licitaciones únicas: {len(seen)}")
     print(f"Guardado {ndjson_path}")
 
     if active_only:
-        active_lics = [lic for lic in all_lics if is_active(lic)]
         json_path = os.path.join(out_dir, "tenders-active.json")
-        with open(json_path, "w", encoding="utf-8") as f:
-            json.dump(active_lics, f, ensure_ascii=False)
+        with open(json_path, "wb") as f:
+            f.write(orjson.dumps(active_lics))
         print(f"Guardado {json_path} con {len(active_lics)} licitaciones activas")
+        active_ndjson_path = os.path.join(out_dir, "tenders-active.ndjson")
+        with open(active_ndjson_path, "wb") as f:
+            for lic in active_lics:
+                f.write(orjson.dumps(lic))
+                f.write(b"\n")
+        print(f"Guardado {active_ndjson_path}")
 
 
 if __name__ == "__main__":